@@ -1,11 +1,31 @@
 import os
-from typing import List
+from typing import Iterator, List
 from pathlib import Path
 import pdfplumber
 from pypdf import PdfReader
 from docx import Document
 import pandas as pd
 
+try:
+    import pymupdf
+    pymupdf.TOOLS.mupdf_display_errors(False)
+except Exception:
+    pymupdf = None
+
+
+# tokenizer of the embedding model, loaded lazily on first chunk;
+# chunking in its tokens keeps every chunk inside the model's context
+EMBED_TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+_tokenizer = None
+
+
+def _get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        from transformers import AutoTokenizer
+        _tokenizer = AutoTokenizer.from_pretrained(EMBED_TOKENIZER_NAME, use_fast=True)
+    return _tokenizer
+
 # Parsers
 def parse_txt(path: str) -> str:
     with open(path, "r", encoding="utf-8", errors="ignore") as f:
@@ -13,6 +33,20 @@ def parse_txt(path: str) -> str:
 
 
 def parse_pdf(path: str) -> str:
+    # PyMuPDF's C core is 5-10x faster than pdfplumber, so try it first;
+    # keep pdfplumber for documents where it extracts nothing (image-only
+    # or oddly encoded pages) and pypdf as the last resort
+    if pymupdf is not None:
+        try:
+            doc = pymupdf.open(path)
+            try:
+                text = "".join(page.get_text() for page in doc)
+            finally:
+                doc.close()
+            if text.strip():
+                return text
+        except Exception:
+            pass
     try:
         text = []
         with pdfplumber.open(path) as pdf:
@@ -36,39 +70,35 @@ def parse_docx(path: str) -> str:
 
 
 def parse_xlsx(path: str) -> str:
-    # read all sheets and concatenate
-    df = pd.read_excel(path, sheet_name=0)
-    # if QA column present, join Q/A pairs, else join textual cells
+    df = pd.read_excel(path, sheet_name=0, engine="openpyxl")
+    # if QA columns present, join Q/A pairs row-wise, else join textual cells.
+    # stay vectorized: iterrows() boxes every cell and is pathologically slow
+    # on large sheets (it also used to return after the first row).
     key_cols = [c for c in df.columns if str(c).lower() in ("q", "question", "a", "answer")]
     if key_cols:
-        texts = []
-        for _, row in df.iterrows():
-            pieces = []
-            for c in key_cols:
-                val = row.get(c)
-                if pd.notna(val):
-                    pieces.append(str(val))
-            if pieces:
-                texts.append(" -- ".join(pieces))
-            return "".join(texts)
-    else:
-        return df.astype(str).apply(lambda row: " ".join(row.values), axis=1).str.cat(sep="")
+        sub = df[key_cols].dropna(how="all")
+        if sub.empty:
+            return ""
+        return sub.fillna("").astype(str).agg(" -- ".join, axis=1).str.cat(sep="")
+    return df.astype(str).apply(lambda row: " ".join(row.values), axis=1).str.cat(sep="")
+
 
+def chunk_text(text: str, chunk_size: int = 256, overlap: int = 32) -> Iterator[str]:
+    """Token-based sliding-window chunker, yielding chunks lazily.
 
-def chunk_text(text: str, chunk_size: int = 800, overlap: int = 100) -> List[str]:
-    """Simple character-based chunker."""
+    chunk_size and overlap are measured in tokens of the embedding model
+    (MiniLM caps at 256), so chunks fill its context exactly instead of
+    the variable token counts a character window produces. Yielding one
+    decoded chunk at a time lets callers stream megabyte documents into
+    the index without holding every chunk string in memory at once.
+    """
     if not text:
-        return []
-    text = text.replace("", "")
-    chunks = []
-    start = 0
-    length = len(text)
-    while start < length:
-        end = min(start + chunk_size, length)
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += chunk_size - overlap
-    return chunks
+        return
+    tok = _get_tokenizer()
+    ids = tok.encode(text, add_special_tokens=False)
+    step = chunk_size - overlap
+    for i in range(0, len(ids), step):
+        yield tok.decode(ids[i:i + chunk_size])
 
 
 def parse_and_chunk_file(path: str):
@@ -85,5 +115,6 @@ def parse_and_chunk_file(path: str):
     else:
         # attempt to read as text
         content = parse_txt(path)
-    chunks = chunk_text(content)
-    return chunks
\ No newline at end of file
+    # materialize: chunk lists cross the ingest process pool boundary,
+    # and generators can't be pickled
+    return list(chunk_text(content))
\ No newline at end of file
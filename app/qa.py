@@ -1,17 +1,96 @@
 import os
 import json
+import queue
+import threading
 from datetime import datetime
 from typing import List
+import torch
 from transformers import pipeline
 
-flan_model = pipeline("text2text-generation", model="google/flan-t5-small", device=-1)
-roberta_model = pipeline("question-answering", model="deepset/tinyroberta-squad2", device=-1)
+# single-threaded torch: the models here are small enough that intra-op
+# parallelism buys little, and extra torch threads just compete with
+# FAISS's OMP pool (see retriever.py) under concurrent requests
+torch.set_num_threads(int(os.environ.get("TORCH_NUM_THREADS", "1")))
+
+# Pipelines are loaded lazily on first use and cached for the process.
+# Loading both models at import doubled startup RAM (~500MB) and cold-start
+# time even when a request only ever touches one of them.
+_models = {}
+
+
+def _get_pipeline(task: str, model_name: str):
+    key = (task, model_name)
+    if key not in _models:
+        pipe = pipeline(task, model=model_name, device=-1)
+        # CPU inference is bandwidth-bound on the fp32 weight matrices;
+        # int8 dynamic quantization of the Linear layers halves the bytes
+        # read per token with negligible quality loss for QA
+        try:
+            pipe.model = torch.quantization.quantize_dynamic(
+                pipe.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        except Exception:
+            # fall back to the fp32 model if quantization is unsupported
+            pass
+        _models[key] = pipe
+    return _models[key]
+
+
+# extractive QA skips the pipeline wrapper entirely: tokenizer + model are
+# held directly so the hot path avoids pipeline's per-call argument
+# normalization and Python-side postprocessing
+_qa_models = {}
+
+
+def _get_qa_model(model_name: str):
+    if model_name not in _qa_models:
+        from transformers import AutoModelForQuestionAnswering, AutoTokenizer
+        tok = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        model = AutoModelForQuestionAnswering.from_pretrained(model_name).eval()
+        try:
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        except Exception:
+            pass
+        _qa_models[model_name] = (tok, model)
+    return _qa_models[model_name]
 
 # ------------------------------
 # Logging function
 # ------------------------------
-def log_qa_interaction(question, answer, score=None, log_path="logs/qa_interactions.log"):
-    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+# Log entries go through a queue drained by a daemon thread, so the
+# request path never waits on the disk. The worker batches entries
+# (up to 50, or a 1s lull) into a single append per write.
+DEFAULT_LOG_PATH = "logs/qa_interactions.log"
+os.makedirs(os.path.dirname(DEFAULT_LOG_PATH), exist_ok=True)
+_log_queue = queue.Queue()
+
+
+def _log_worker():
+    while True:
+        batch = [_log_queue.get()]
+        try:
+            while len(batch) < 50:
+                batch.append(_log_queue.get(timeout=1.0))
+        except queue.Empty:
+            pass
+        by_path = {}
+        for log_path, entry in batch:
+            by_path.setdefault(log_path, []).append(entry)
+        for log_path, entries in by_path.items():
+            try:
+                with open(log_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+            except Exception:
+                # logging must never take down the worker
+                pass
+
+
+threading.Thread(target=_log_worker, daemon=True).start()
+
+
+def log_qa_interaction(question, answer, score=None, log_path=DEFAULT_LOG_PATH):
     entry = {
         "timestamp": datetime.now().isoformat() + "Z",
         "question": question,
@@ -19,8 +98,7 @@ def log_qa_interaction(question, answer, score=None, log_path="logs/qa_interacti
     }
     if score is not None:
         entry["Confidence score"] = score
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    _log_queue.put((log_path, entry))
 
 
 # ------------------------------
@@ -37,6 +115,7 @@ Context:
 
 Question: {question}
 """
+    flan_model = _get_pipeline("text2text-generation", "google/flan-t5-small")
     result = flan_model(prompt, max_length=150, min_length=30, do_sample=False)[0]
     answer = result.get("generated_text", "").strip()
 
@@ -52,9 +131,45 @@ Question: {question}
 # ------------------------------
 def answer_with_roberta(question: str, contexts: List[str]) -> str:
     context_text = "\n".join(contexts)
-    result = roberta_model(question=question, context=context_text)
-    answer = result.get("answer", "").strip()
-    score = result.get("score", 0)
+    tok, model = _get_qa_model("deepset/tinyroberta-squad2")
+
+    # tokenize once; long contexts become overlapping features (stride)
+    # that run through the model as a single batch
+    enc = tok(
+        question,
+        context_text,
+        truncation="only_second",
+        max_length=384,
+        stride=128,
+        return_overflowing_tokens=True,
+        return_offsets_mapping=True,
+        padding=True,
+        return_tensors="pt",
+    )
+    offsets = enc.pop("offset_mapping")
+    enc.pop("overflow_to_sample_mapping", None)
+    with torch.inference_mode():
+        out = model(input_ids=enc["input_ids"], attention_mask=enc["attention_mask"])
+
+    # best span across features: joint start/end probability over valid
+    # spans (end >= start, bounded length), restricted to context tokens
+    # (sequence id 1). Independent argmaxes can land end before start.
+    answer = ""
+    score = 0.0
+    max_answer_len = 30
+    for i in range(enc["input_ids"].shape[0]):
+        in_context = torch.tensor([sid == 1 for sid in enc.sequence_ids(i)])
+        start_p = torch.softmax(out.start_logits[i], dim=-1).masked_fill(~in_context, 0.0)
+        end_p = torch.softmax(out.end_logits[i], dim=-1).masked_fill(~in_context, 0.0)
+        span_p = start_p.unsqueeze(1) * end_p.unsqueeze(0)
+        # keep spans with start <= end < start + max_answer_len
+        span_p = torch.triu(span_p) - torch.triu(span_p, diagonal=max_answer_len)
+        flat = int(torch.argmax(span_p))
+        start, end = divmod(flat, span_p.shape[1])
+        span_score = float(span_p[start][end])
+        if span_score > score:
+            score = span_score
+            answer = context_text[offsets[i][start][0]: offsets[i][end][1]].strip()
 
     if not answer or score < 0.1:
         answer = "I don’t know, but I can help search for more info."
@@ -1,6 +1,9 @@
+import functools
 import os
-from typing import List, Dict
+import threading
+from typing import List, Dict, Union
 import json
+import pickle
 from sentence_transformers import SentenceTransformer
 import numpy as np
 
@@ -11,6 +14,50 @@ except Exception:
     faiss = None
 
 
+# FAISS sizes its OMP pool to all logical cores by default, which
+# oversubscribes the CPU once torch's own pool joins in under concurrent
+# requests; pin it to physical cores (half the logical count is a good
+# proxy), overridable the same way as MAX_INGEST_WORKERS
+if faiss is not None:
+    try:
+        faiss.omp_set_num_threads(
+            int(os.environ.get("FAISS_NUM_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+        )
+    except Exception:
+        pass
+
+
+# embedding models cached per process, keyed on model name, so multiple
+# Retriever instances (or reloads) don't each pay the load cost
+_st_models: Dict[str, SentenceTransformer] = {}
+
+
+def _get_sentence_model(name: str) -> SentenceTransformer:
+    if name not in _st_models:
+        _st_models[name] = SentenceTransformer(name)
+    return _st_models[name]
+
+
+# reranking cross-encoder, loaded lazily like the other models; int8
+# dynamic quantization keeps its CPU cost at ~20ms for K=20 pairs
+_cross_encoders: Dict[str, object] = {}
+
+
+def _get_cross_encoder(name: str):
+    if name not in _cross_encoders:
+        from sentence_transformers import CrossEncoder
+        ce = CrossEncoder(name)
+        try:
+            import torch
+            ce.model = torch.quantization.quantize_dynamic(
+                ce.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        except Exception:
+            pass
+        _cross_encoders[name] = ce
+    return _cross_encoders[name]
+
+
 class Retriever:
     """Lightweight FAISS-backed retriever using SentenceTransformers.
 
@@ -20,14 +67,37 @@ class Retriever:
     - search the index for nearest neighbors to a query
     """
 
+    # IVF+PQ parameters: 256 cells, 16-byte PQ codes. The usual faiss
+    # guideline is ~40 training vectors per cell, so we keep a cheap HNSW
+    # index (no training step) until the corpus is big enough to train on.
+    IVF_FACTORY = "IVF256,PQ16"
+    IVF_TRAIN_SIZE = 40 * 256
+    NPROBE = 8
+    HNSW_EF_SEARCH = 64
+
+    # retrieve-then-rerank: FAISS returns RERANK_MULTIPLIER * top_k
+    # candidates cheaply, the cross-encoder rescores just those pairs
+    CROSS_ENCODER_NAME = "cross-encoder/ms-marco-MiniLM-L-2-v2"
+    RERANK_MULTIPLIER = 5
+
     def __init__(self, index_path: str, meta_path: str, embed_model_name: str = "all-MiniLM-L6-v2"):
         self.index_path = index_path
         self.meta_path = meta_path
-        self.model = SentenceTransformer(embed_model_name)
+        self.model = _get_sentence_model(embed_model_name)
         # dimension of the sentence embeddings
         self.dim = self.model.get_sentence_embedding_dimension()
         self.index = None
-        self.metadatas: List[Dict] = []
+        # chunk metadata as parallel lists rather than a list of dicts:
+        # half the per-entry PyObject overhead and much faster to serialize
+        self._texts: List[str] = []
+        self._sources: List[str] = []
+        # per-instance LRU over query embeddings: repeated questions skip
+        # the ~20ms CPU encode (lru_cache can't live on the method itself
+        # because instances aren't hashable)
+        self._embed_query = functools.lru_cache(maxsize=1024)(self._embed_query)
+        # guards the index and metadata lists: FAISS adds aren't safe
+        # against concurrent searches, and save() snapshots under it
+        self._lock = threading.RLock()
         self._load()
 
     def _load(self):
@@ -38,33 +108,124 @@ class Retriever:
             except Exception:
                 self.index = None
 
-        # load metadata json if present
+        # load metadata if present
         if os.path.exists(self.meta_path):
+            loaded = None
             try:
-                with open(self.meta_path, "r", encoding="utf-8") as f:
-                    self.metadatas = json.load(f)
+                with open(self.meta_path, "rb") as f:
+                    loaded = pickle.load(f)
             except Exception:
-                self.metadatas = []
+                # migrate metadata persisted as JSON by older versions
+                try:
+                    with open(self.meta_path, "r", encoding="utf-8") as f:
+                        loaded = json.load(f)
+                except Exception:
+                    loaded = None
+            if isinstance(loaded, dict):
+                self._texts = list(loaded.get("texts", []))
+                self._sources = list(loaded.get("sources", []))
+            elif isinstance(loaded, list):
+                # migrate the old list-of-dicts layout
+                self._texts = [m.get("text") for m in loaded]
+                self._sources = [m.get("source") for m in loaded]
 
         # if index not loaded, create a new one
         if self.index is None:
             if faiss is None:
                 raise RuntimeError("faiss is required. Please install faiss-cpu or faiss-gpu.")
-            # simple flat L2 index
-            self.index = faiss.IndexFlatL2(self.dim)
+            self.index = self._new_index()
+        self._tune_index(self.index)
+
+    def _new_index(self):
+        """Create an empty index for a fresh (small) corpus.
+
+        HNSW needs no training and beats IVF on small corpora; once enough
+        vectors accumulate, `add_documents` migrates to IVF+PQ.
+
+        Embeddings are L2-normalized before insertion, so inner product
+        equals cosine similarity — the metric all-MiniLM-L6-v2 was trained
+        for. Scores are therefore higher-is-better.
+        """
+        index = faiss.IndexHNSWFlat(self.dim, 32, faiss.METRIC_INNER_PRODUCT)
+        return index
+
+    def _tune_index(self, index):
+        # apply search-time knobs; harmless on index types that lack them
+        if hasattr(index, "nprobe"):
+            index.nprobe = self.NPROBE
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = self.HNSW_EF_SEARCH
+
+    def _maybe_upgrade_index(self, embeddings):
+        """Migrate from HNSW to a trained IVF+PQ index once the corpus is large.
+
+        IVF+PQ compresses vectors to 16-byte codes and searches only `nprobe`
+        cells instead of scanning everything, but it needs training data, so
+        the switch happens lazily when enough vectors are about to exist.
+        `embeddings` is the batch about to be added; existing vectors are
+        carried over from the HNSW index, which stores them in full.
+        """
+        if not isinstance(self.index, faiss.IndexHNSWFlat):
+            return
+        if self.index.ntotal + len(embeddings) < self.IVF_TRAIN_SIZE:
+            return
+        try:
+            if self.index.ntotal > 0:
+                old = self.index.reconstruct_n(0, self.index.ntotal)
+                train_set = np.vstack([old, embeddings])
+            else:
+                old = None
+                train_set = embeddings
+            new_index = faiss.index_factory(self.dim, self.IVF_FACTORY, faiss.METRIC_INNER_PRODUCT)
+            new_index.train(train_set)
+            if old is not None:
+                new_index.add_with_ids(old, np.arange(len(old), dtype=np.int64))
+            self._tune_index(new_index)
+            self.index = new_index
+        except Exception:
+            # keep serving from the HNSW index if migration fails
+            pass
 
     def save(self):
-        # persist index and metadata
-        if faiss is not None and self.index is not None:
+        # persist index and metadata. Both are written to a sibling tmp
+        # file and swapped in with os.replace, so a reader (or a crash
+        # mid-write) never sees a half-written file. The lock is held only
+        # to snapshot (the index via an in-memory clone, the metadata
+        # lists via shallow copies); the slow disk writes run outside it
+        # so concurrent searches don't stall on the save.
+        index_snapshot = None
+        with self._lock:
+            if faiss is not None and self.index is not None:
+                try:
+                    index_snapshot = faiss.clone_index(self.index)
+                except Exception:
+                    # clone unsupported: write under the lock rather than
+                    # race a concurrent add
+                    try:
+                        tmp_idx = self.index_path + ".tmp"
+                        faiss.write_index(self.index, tmp_idx)
+                        os.replace(tmp_idx, self.index_path)
+                    except Exception:
+                        # ignore write failures here; caller can handle
+                        pass
+            texts = list(self._texts)
+            sources = list(self._sources)
+
+        if index_snapshot is not None:
             try:
-                faiss.write_index(self.index, self.index_path)
+                tmp_idx = self.index_path + ".tmp"
+                faiss.write_index(index_snapshot, tmp_idx)
+                os.replace(tmp_idx, self.index_path)
             except Exception:
-                # ignore write failures here; caller can handle
                 pass
 
         try:
-            with open(self.meta_path, "w", encoding="utf-8") as f:
-                json.dump(self.metadatas, f, ensure_ascii=False, indent=2)
+            # binary pickle: several times smaller and faster to load than
+            # the indented JSON this used to write for large corpora
+            tmp_meta = self.meta_path + ".tmp"
+            with open(tmp_meta, "wb") as f:
+                pickle.dump({"texts": texts, "sources": sources}, f, protocol=5)
+            os.replace(tmp_meta, self.meta_path)
         except Exception:
             pass
 
@@ -78,8 +239,11 @@ class Retriever:
             raise RuntimeError("faiss is required to create or reset the index")
 
         # create a fresh index
-        self.index = faiss.IndexFlatL2(self.dim)
-        self.metadatas = []
+        with self._lock:
+            self.index = self._new_index()
+            self._tune_index(self.index)
+            self._texts = []
+            self._sources = []
 
         if remove_files:
             try:
@@ -99,25 +263,140 @@ class Retriever:
         texts: list of text chunks
         sources: list of source file paths (same length)
         """
-        embeddings = self.model.encode(texts, show_progress_bar=False, convert_to_numpy=True)
-        # ensure embeddings have batch dimension
-        if len(embeddings.shape) == 1:
-            embeddings = np.expand_dims(embeddings, 0)
+        # same insertion path as bulk adds, with one chunk per "file"
+        self.add_documents_bulk([[t] for t in texts], sources)
+
+    def add_documents_bulk(self, texts_per_file: List[List[str]], sources_per_file: List[str]):
+        """Add chunks from several files with a single batched encode.
+
+        texts_per_file: one list of chunks per file
+        sources_per_file: the source file path for each chunk list
+
+        Encoding everything in one call lets SentenceTransformers sort by
+        length and fill batches across file boundaries, which is far faster
+        than one small encode per file.
+        """
+        all_texts: List[str] = []
+        all_sources: List[str] = []
+        for texts, source in zip(texts_per_file, sources_per_file):
+            all_texts.extend(texts)
+            all_sources.extend([source] * len(texts))
+        if not all_texts:
+            return
+
+        embeddings = self.model.encode(
+            all_texts,
+            batch_size=64,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        # encode already returns float32; only copy when it doesn't
+        if embeddings.dtype != np.float32:
+            embeddings = embeddings.astype(np.float32, copy=False)
+        if not embeddings.flags.c_contiguous:
+            embeddings = np.ascontiguousarray(embeddings)
+        # encoding ran outside the lock; only the index/metadata mutation
+        # needs to exclude concurrent searches and saves
+        with self._lock:
+            self._maybe_upgrade_index(embeddings)
+            self._add_vectors(embeddings)
+            self._texts.extend(all_texts)
+            self._sources.extend(all_sources)
 
-        # FAISS expects float32
-        self.index.add(embeddings.astype('float32'))
-        for t, s in zip(texts, sources):
-            self.metadatas.append({"text": t, "source": s})
+    def _add_vectors(self, embeddings):
+        """Insert a batch of vectors with ids aligned to the metadata lists.
 
-    def search(self, query: str, top_k: int = 4) -> List[Dict]:
+        IVF indexes take explicit ids via `add_with_ids`, which pins each
+        vector to its position in `self._texts` regardless of insertion
+        order. HNSW has no id map and raises on `add_with_ids`, but it only
+        ever sees sequential appends, so plain `add` assigns the same ids.
+        """
+        ids = np.arange(len(self._texts), len(self._texts) + len(embeddings), dtype=np.int64)
+        try:
+            self.index.add_with_ids(embeddings, ids)
+        except Exception:
+            self.index.add(embeddings)
+
+    def _embed_query(self, query: str):
+        """Embed a single query; wrapped with an LRU cache in __init__.
+
+        The returned array is shared between cache hits, so it is marked
+        read-only.
+        """
         q_emb = self.model.encode([query], convert_to_numpy=True)
-        if q_emb.dtype != "float32":
-            q_emb = q_emb.astype('float32')
-        D, I = self.index.search(q_emb, top_k)
-        results: List[Dict] = []
-        for score, idx in zip(D[0], I[0]):
-            if idx < 0 or idx >= len(self.metadatas):
-                continue
-            meta = self.metadatas[idx]
-            results.append({"score": float(score), "text": meta.get("text"), "source": meta.get("source")})
-        return results
\ No newline at end of file
+        if q_emb.dtype != np.float32:
+            q_emb = q_emb.astype(np.float32, copy=False)
+        faiss.normalize_L2(q_emb)
+        q_emb.flags.writeable = False
+        return q_emb
+
+    def search(self, queries: Union[str, List[str]], top_k: int = 4) -> Union[List[Dict], List[List[Dict]]]:
+        """Search for nearest neighbors to one query or a batch of queries.
+
+        A single query string returns a list of hit dicts (as before); a
+        list of query strings returns one such list per query. The batch
+        goes to FAISS as a (B, d) matrix in a single search call, which
+        amortizes its SIMD/OMP setup across queries.
+        """
+        single = isinstance(queries, str)
+        if single:
+            q_embs = self._embed_query(queries)
+            query_list = [queries]
+        else:
+            if not queries:
+                return []
+            query_list = list(queries)
+            q_embs = self.model.encode(
+                query_list,
+                batch_size=32,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+            )
+            if q_embs.dtype != np.float32:
+                q_embs = q_embs.astype(np.float32, copy=False)
+            faiss.normalize_L2(q_embs)
+        # over-fetch so the cross-encoder has candidates to choose from;
+        # the lock keeps the FAISS search and metadata lookup consistent
+        # with a concurrent add, while reranking runs outside it
+        with self._lock:
+            D, I = self.index.search(q_embs, top_k * self.RERANK_MULTIPLIER)
+            candidate_lists: List[List[Dict]] = []
+            for row_scores, row_ids in zip(D, I):
+                results: List[Dict] = []
+                # scores are cosine similarities (higher is better)
+                for score, idx in zip(row_scores, row_ids):
+                    if idx < 0 or idx >= len(self._texts):
+                        continue
+                    results.append({"score": float(score), "text": self._texts[idx], "source": self._sources[idx]})
+                candidate_lists.append(results)
+        batched = [
+            self._rerank(query, results, top_k)
+            for query, results in zip(query_list, candidate_lists)
+        ]
+        return batched[0] if single else batched
+
+    def _rerank(self, query: str, candidates: List[Dict], top_k: int) -> List[Dict]:
+        """Rescore FAISS candidates with the cross-encoder and keep top_k.
+
+        The bi-encoder is cheap but scores query and chunk independently;
+        the cross-encoder reads each (query, chunk) pair jointly and ranks
+        far more accurately. Running it only on the handful of FAISS
+        candidates keeps its cost independent of corpus size. If the
+        cross-encoder can't load, the bi-encoder order is kept as-is.
+        """
+        if len(candidates) <= top_k:
+            return candidates
+        try:
+            ce = _get_cross_encoder(self.CROSS_ENCODER_NAME)
+            scores = ce.predict(
+                [(query, c["text"]) for c in candidates],
+                batch_size=32,
+                show_progress_bar=False,
+            )
+        except Exception:
+            return candidates[:top_k]
+        for c, score in zip(candidates, scores):
+            c["score"] = float(score)
+        candidates.sort(key=lambda c: c["score"], reverse=True)
+        return candidates[:top_k]
\ No newline at end of file